@@ -1,11 +1,56 @@
-import numpy as np, pandas as pd, json
-from sqlalchemy import create_engine, text, delete
+import numpy as np, pandas as pd, pyarrow as pa, json, queue, signal, threading
+from datetime import datetime, time, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import (
+    create_engine,
+    text,
+    delete,
+    select,
+    bindparam,
+    and_,
+    or_,
+    MetaData,
+)
 from sqlalchemy.orm import sessionmaker
 
 from lotus_dashboard.database import Base
+from lotus_dashboard.change_capture import get_change_source
+from lotus_dashboard.export import write_frame
+from lotus_dashboard.filter_values import build_filter_values, filter_values_statement
+from lotus_dashboard.sketch import (
+    SKETCH_METRICS,
+    build_sketches,
+    fingerprint_days,
+    sketch_rows,
+)
+from lotus_dashboard.profiling import CycleProfiler
 import lotus_dashboard.models as models
 from lotus_dashboard.models.lead_insight import LeadInsight
+from lotus_dashboard.models.lead_insight_filter import LeadInsightFilter
 from lotus_dashboard.models.user_performance import UserPerformance
+from lotus_dashboard.models.user_performance_sketch import UserPerformanceSketch
+from lotus_dashboard.models.user_performance_filter import UserPerformanceFilter
+
+# low cardinality columns, read as categories so the merges don't copy the strings
+CATEGORY_COLUMNS = [
+    "status",
+    "task_status",
+    "loi_status",
+    "role",
+    "type",
+    "category",
+    "store_format",
+    "source",
+    "brand_type",
+    "rent_type",
+    "size_range",
+]
+
+# native filter value tables, rebuilt after every refresh of their dataset
+FILTER_MODELS = {
+    LeadInsight: LeadInsightFilter,
+    UserPerformance: UserPerformanceFilter,
+}
 
 
 class LotosDashboardCron:
@@ -14,8 +59,28 @@ class LotosDashboardCron:
         self.local_engine = None
         self.server_engine = None
         self.config = self.load_config(path)
+        self.change_source = None
+        self.base = None
+        self.sketch_fingerprints = None
+        self.stale_sketch_days = set()
+        self.cycles_since_full_refresh = 0
+        self.init_profiler()
         self.init_db()
 
+    def init_profiler(self):
+        # PROFILE_NEXT_CYCLE profiles the first cycle after start,
+        # `kill -USR1 <pid>` the next one of a running cron
+        self.profiler = CycleProfiler(
+            self.config.get("PROFILE_DIR", "profiles"),
+            self.config.get("PROFILE_TOP_ALLOCATIONS", 10),
+        )
+        if self.config.get("PROFILE_NEXT_CYCLE", False):
+            self.profiler.request()
+        if hasattr(signal, "SIGUSR1") and (
+            threading.current_thread() is threading.main_thread()
+        ):
+            signal.signal(signal.SIGUSR1, self.profiler.request)
+
     def init_db(self):
         local_engine = self.get_local_engine()
         Base.metadata.create_all(bind=local_engine)
@@ -70,46 +135,433 @@ class LotosDashboardCron:
         self.init_db()
 
     def import_csv_to_db(self, model: Base, csv_file: str):
-        df = pd.read_csv(csv_file)
-        df.where(df.notnull(), None)
-        df.replace({np.nan: None, pd.NaT: None, "NaT": None, "NaN": None}, inplace=True)
-        records = df.to_dict(orient="records")
+        df = self.to_categories(pd.read_csv(csv_file, dtype_backend="pyarrow"))
+        records = self.dataframe_to_records(df)
         sess = self.get_session()
         sess.execute(text(f"TRUNCATE TABLE `{model.__tablename__}`"))
         sess.bulk_insert_mappings(model, records)
         sess.commit()
         sess.close()
 
+    def to_categories(self, df: pd.DataFrame):
+        for column in CATEGORY_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype("category")
+        return df
+
+    def read_sql(self, query, conn, params: dict = None):
+        df = pd.read_sql(query, conn, params=params, dtype_backend="pyarrow")
+        return self.to_categories(df)
+
+    def dataframe_to_records(self, df: pd.DataFrame):
+        # arrow maps NaN/NaT/NA to None itself, no replace pass over the frame
+        return pa.Table.from_pandas(df, preserve_index=False).to_pylist()
+
     def dataframe_to_db(self, model: Base, df: pd.DataFrame):
-        df.where(df.notnull(), None)
-        df.replace({np.nan: None, pd.NaT: None, "NaT": None, "NaN": None}, inplace=True)
-        records = df.to_dict(orient="records")
+        if self.config.get("LOAD_PARALLELISM", 1) > 1:
+            self.dataframe_to_db_parallel(model, df)
+            return
+        records = self.dataframe_to_records(df)
         sess = self.get_session()
         sess.execute(text(f"TRUNCATE TABLE `{model.__tablename__}`"))
         sess.bulk_insert_mappings(model, records)
         sess.commit()
         sess.close()
 
+    def dataframe_to_db_parallel(self, model: Base, df: pd.DataFrame):
+        # primary key ranges go into a staging table over several connections,
+        # then one RENAME TABLE swaps it in so readers see the old or the new rows
+        parallelism = self.config["LOAD_PARALLELISM"]
+        local_engine = self.get_local_engine()
+        table = model.__tablename__
+        staging = f"{table}_staging"
+        staging_table = model.__table__.to_metadata(MetaData(), name=staging)
+        columns = [column.name for column in model.__table__.c if column.name in df]
+        records = self.dataframe_to_records(df[columns])
+        for i, record in enumerate(records, 1):
+            record["id"] = i
+        size = max(1, -(-len(records) // parallelism))
+        chunks = [records[i : i + size] for i in range(0, len(records), size)]
+
+        with local_engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS `{staging}`"))
+            conn.execute(text(f"CREATE TABLE `{staging}` LIKE `{table}`"))
+
+        def insert_chunk(chunk: list):
+            with local_engine.begin() as conn:
+                conn.execute(staging_table.insert(), chunk)
+
+        try:
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                list(executor.map(insert_chunk, chunks))
+        except Exception:
+            with local_engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS `{staging}`"))
+            raise
+
+        with local_engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS `{table}_old`"))
+            conn.execute(
+                text(
+                    f"RENAME TABLE `{table}` TO `{table}_old`, `{staging}` TO `{table}`"
+                )
+            )
+            conn.execute(text(f"DROP TABLE `{table}_old`"))
+
+    def best_effort(self, name: str, step):
+        # side outputs log their own failure, the dashboard tables are already loaded
+        try:
+            with self.profiler.stage(name):
+                step()
+        except Exception as e:
+            print(f"{name} failed: {e!r}", datetime.now())
+
+    def publish(self, model: Base, df: pd.DataFrame):
+        if model is UserPerformance:
+            # percentile charts read these instead of scanning user_performance
+            self.best_effort("sketch user_performance", lambda: self.load_sketches(df))
+        if model in FILTER_MODELS:
+            self.best_effort(
+                f"filter values {model.__tablename__}",
+                lambda: self.dataframe_to_db(
+                    FILTER_MODELS[model], build_filter_values(model.__tablename__, df)
+                ),
+            )
+        if "EXPORT_DIR" in self.config:
+            self.best_effort(
+                f"export {model.__tablename__}", lambda: self.export(model, df)
+            )
+
+    def export(self, model: Base, df: pd.DataFrame):
+        write_frame(
+            self.config["EXPORT_DIR"],
+            model.__tablename__,
+            df,
+            self.config.get("EXPORT_KEEP", 5),
+        )
+
+    def load_sketches(self, df: pd.DataFrame):
+        # only the days whose rows changed since the last build are sketched again
+        df_rows = sketch_rows(df)
+        fingerprints = fingerprint_days(df_rows)
+        if self.sketch_fingerprints is None:
+            self.dataframe_to_db(UserPerformanceSketch, build_sketches(df_rows))
+        else:
+            previous = self.sketch_fingerprints
+            days = [
+                day
+                for day in fingerprints.index.union(previous.index)
+                if fingerprints.get(day) != previous.get(day)
+                or day in self.stale_sketch_days
+            ]
+            if days:
+                self.replace_sketch_days(days, build_sketches(df_rows, days))
+        self.sketch_fingerprints = fingerprints
+        self.stale_sketch_days = set()
+
+    def select_sketch_days(self, lead_ids: set, deal_ids: set):
+        statement = (
+            select(UserPerformance.task_created_at)
+            .distinct()
+            .where(
+                or_(
+                    UserPerformance.lead_id.in_(list(lead_ids)),
+                    UserPerformance.deal_id.in_(list(deal_ids)),
+                )
+            )
+        )
+        with self.get_local_engine().connect() as conn:
+            return {row[0].date() for row in conn.execute(statement) if row[0]}
+
+    def update_sketch_days(self, days: set):
+        # re-sketch whole days from the loaded table, the frame only holds the touched deals
+        if not days:
+            return
+        created_at = UserPerformance.task_created_at
+        statement = select(
+            UserPerformance.deal_task_id,
+            UserPerformance.deal_comment_id,
+            UserPerformance.assigned_group,
+            UserPerformance.group_name,
+            UserPerformance.code,
+            created_at,
+            *[getattr(UserPerformance, metric) for metric in SKETCH_METRICS],
+        ).where(
+            or_(
+                *[
+                    and_(
+                        created_at >= datetime.combine(day, time()),
+                        created_at < datetime.combine(day + timedelta(days=1), time()),
+                    )
+                    for day in days
+                ]
+            )
+        )
+        with self.get_local_engine().connect() as conn:
+            df = pd.read_sql(statement, conn)
+        self.replace_sketch_days(days, build_sketches(sketch_rows(df)))
+        # the fingerprints predate these rows, the next full refresh redoes the days
+        self.stale_sketch_days |= days
+
+    def replace_sketch_days(self, days: list, df_sketch: pd.DataFrame):
+        records = self.dataframe_to_records(df_sketch)
+        sess = self.get_session()
+        sess.execute(
+            delete(UserPerformanceSketch).where(UserPerformanceSketch.day.in_(days))
+        )
+        sess.bulk_insert_mappings(UserPerformanceSketch, records)
+        sess.commit()
+        sess.close()
+
+    def replace_rows(self, model: Base, df: pd.DataFrame, lead_ids: set, deal_ids: set):
+        records = self.dataframe_to_records(df)
+        sess = self.get_session()
+        sess.execute(
+            delete(model).where(
+                or_(
+                    model.lead_id.in_(list(lead_ids)),
+                    model.deal_id.in_(list(deal_ids)),
+                )
+            )
+        )
+        sess.bulk_insert_mappings(model, records)
+        sess.commit()
+        sess.close()
+
+    def load_worker(self, load_queue: queue.Queue, errors: list, loaded: list, load):
+        # runs on the writer thread, every load opens its own session
+        while True:
+            item = load_queue.get()
+            if item is None:
+                break
+            model, df = item
+            if errors:
+                continue
+            try:
+                with self.profiler.stage(f"load {model.__tablename__}"):
+                    load(model, df)
+                loaded.append(item)
+            except Exception as e:
+                errors.append(e)
+
+    def run_pipeline(self, data: tuple, load, publish=None):
+        # loads run on a writer thread so they overlap with the next transform
+        load_queue = queue.Queue(maxsize=self.config.get("LOAD_QUEUE_SIZE", 1))
+        errors = []
+        loaded = []
+        writer = threading.Thread(
+            target=self.load_worker,
+            args=(load_queue, errors, loaded, load),
+            daemon=True,
+        )
+        writer.start()
+        try:
+            with self.profiler.stage("fetch_lead_insight"):
+                df_lead_insight = self.fetch_lead_insight(data)
+            load_queue.put((LeadInsight, df_lead_insight))
+            with self.profiler.stage("fetch_user_performance"):
+                df_user_performance = self.fetch_user_performance(data)
+            load_queue.put((UserPerformance, df_user_performance))
+        finally:
+            load_queue.put(None)
+            writer.join()
+            self.base = None
+        # side outputs wait for both dashboard tables and never fail the cycle
+        if publish is not None:
+            for model, df in loaded:
+                publish(model, df)
+        if errors:
+            raise errors[0]
+
     def fetch(self):
-        data = self.fetch_data()
-        df_lead_insight = self.fetch_lead_insight(data)
-        df_user_performance = self.fetch_user_performance(data)
-        self.dataframe_to_db(LeadInsight, df_lead_insight)
-        self.dataframe_to_db(UserPerformance, df_user_performance)
+        with self.profiler.stage("fetch_data"):
+            data = self.fetch_data()
+        # only full refreshes are exported, incremental frames hold a few leads
+        self.run_pipeline(data, self.dataframe_to_db, self.publish)
+        self.cycles_since_full_refresh = 0
+
+    def refresh(self):
+        with self.profiler.cycle():
+            self.refresh_tables()
+
+    def refresh_tables(self):
+        if "CHANGE_CAPTURE" not in self.config:
+            self.fetch()
+            return
+        change_config = self.config["CHANGE_CAPTURE"]
+        if self.change_source is None:
+            # take the change position before the first full refresh so nothing is missed
+            with self.get_server_engine().connect() as conn:
+                self.change_source = get_change_source(self.config, conn)
+            self.fetch()
+            return
+        changes = self.change_source.read()
+        self.cycles_since_full_refresh += 1
+        # is_recent_task_on_deal looks across deals, a periodic full refresh reconciles it
+        if self.cycles_since_full_refresh >= change_config.get(
+            "FULL_REFRESH_EVERY", 60
+        ):
+            self.fetch()
+            return
+        if not changes:
+            return
+        lead_ids, deal_ids = self.resolve_changes(changes)
+        if len(lead_ids) > change_config.get("MAX_LEADS", 5000):
+            self.fetch()
+            return
+        self.fetch_incremental(lead_ids, deal_ids)
+
+    def fetch_incremental(self, lead_ids: set, deal_ids: set):
+        with self.profiler.stage("fetch_data"):
+            data = self.fetch_data(lead_ids)
+        # the days the touched rows sit on before the load, the new rows add theirs
+        days = self.select_sketch_days(lead_ids, deal_ids)
+        self.run_pipeline(
+            data,
+            lambda model, df: self.replace_rows(model, df, lead_ids, deal_ids),
+            lambda model, df: self.publish_incremental(model, df, days),
+        )
+
+    def publish_incremental(self, model: Base, df: pd.DataFrame, days: set):
+        if model is UserPerformance:
+            self.best_effort(
+                "sketch user_performance",
+                lambda: self.update_sketch_days(
+                    days | set(sketch_rows(df)["day"].dropna())
+                ),
+            )
+        if model in FILTER_MODELS:
+            self.best_effort(
+                f"filter values {model.__tablename__}",
+                lambda: self.load_filter_values(model),
+            )
+        if "EXPORT_DIR" in self.config:
+            self.best_effort(
+                f"export {model.__tablename__}",
+                lambda: self.export(model, self.read_table(model, df.columns)),
+            )
+
+    def load_filter_values(self, model: Base):
+        # the frame only holds the touched deals, group the updated table instead
+        with self.get_local_engine().connect() as conn:
+            df = pd.read_sql(filter_values_statement(model), conn)
+        self.dataframe_to_db(FILTER_MODELS[model], df)
+
+    def read_table(self, model: Base, columns: list):
+        # the loaded table in the fetched frame's columns, the ones a full export has
+        table = model.__table__
+        statement = select(*[table.c[name] for name in columns]).order_by(table.c.id)
+        with self.get_local_engine().connect() as conn:
+            return self.read_sql(statement, conn)
+
+    def select_ids(self, conn, query: str, ids: set):
+        ids = [i for i in ids if i is not None]
+        if not ids:
+            return []
+        statement = text(query).bindparams(bindparam("ids", expanding=True))
+        return conn.execute(statement, {"ids": ids}).fetchall()
+
+    def resolve_changes(self, changes: list):
+        lead_ids, deal_ids = set(), set()
+        mall_ids, area_ids, group_ids, user_ids = set(), set(), set(), set()
+        for table, row in changes:
+            if table == "lead":
+                lead_ids.add(row.get("id"))
+            elif table == "deal":
+                deal_ids.add(row.get("id"))
+                lead_ids.add(row.get("lead_id"))
+            elif table == "area_deal":
+                deal_ids.add(row.get("deal_id"))
+                lead_ids.add(row.get("lead_id"))
+            elif table in ("deal_task", "deal_comment"):
+                deal_ids.add(row.get("deal_id"))
+            elif table == "mall":
+                mall_ids.add(row.get("id"))
+            elif table == "area":
+                area_ids.add(row.get("id"))
+            elif table == "group":
+                group_ids.add(row.get("id"))
+            elif table == "user":
+                user_ids.add(row.get("id"))
+            elif table == "user_access":
+                group_ids.add(row.get("group_id"))
+                user_ids.add(row.get("user_id"))
+
+        with self.get_server_engine().connect() as conn:
+            # dimension changes fan out to the deals that reference them
+            area_deals = self.select_ids(
+                conn, "select deal_id from area_deal where mall_id in :ids", mall_ids
+            ) + self.select_ids(
+                conn, "select deal_id from area_deal where area_id in :ids", area_ids
+            )
+            # mall rows reach user_performance through the group code
+            group_ids.update(
+                row[0]
+                for row in self.select_ids(
+                    conn,
+                    "select g.id from `group` g join mall m on m.code = g.code where m.id in :ids",
+                    mall_ids,
+                )
+            )
+            group_ids.update(
+                row[0]
+                for row in self.select_ids(
+                    conn,
+                    "select group_id from user_access where user_id in :ids",
+                    user_ids,
+                )
+            )
+            task_deals = self.select_ids(
+                conn, "select deal_id from deal_task where group_id in :ids", group_ids
+            ) + self.select_ids(
+                conn, "select deal_id from deal_comment where user_id in :ids", user_ids
+            )
+            deal_ids.update(row[0] for row in area_deals + task_deals)
+            lead_ids.update(
+                row[0]
+                for row in self.select_ids(
+                    conn, "select lead_id from deal where id in :ids", deal_ids
+                )
+            )
+        lead_ids.discard(None)
+        deal_ids.discard(None)
+        return lead_ids, deal_ids
 
-    def fetch_data(self):
+    def fetch_data(self, lead_ids: set = None):
         engine = self.get_server_engine()
         conn = engine.connect()
-        df_lead = pd.read_sql("select * from `lead`", conn)
-        df_deal = pd.read_sql("select * from deal", conn)
-        df_mall = pd.read_sql("select * from mall", conn)
-        df_area = pd.read_sql("select * from area", conn)
-        df_area_deal = pd.read_sql("select * from area_deal", conn)
-        df_group = pd.read_sql("select * from `group`", conn)
-        df_deal_task = pd.read_sql("select * from deal_task", conn)
-        df_deal_comment = pd.read_sql("select * from deal_comment", conn)
-        df_user = pd.read_sql("select * from user", conn)
-        df_user_access = pd.read_sql("select * from user_access", conn)
+        if lead_ids is None:
+            df_lead = self.read_sql("select * from `lead`", conn)
+            df_deal = self.read_sql("select * from deal", conn)
+            df_area = self.read_sql("select * from area", conn)
+            df_area_deal = self.read_sql("select * from area_deal", conn)
+            df_deal_task = self.read_sql("select * from deal_task", conn)
+            df_deal_comment = self.read_sql("select * from deal_comment", conn)
+        else:
+            # only the given leads, their deals and everything hanging off those deals
+            params = {"ids": list(lead_ids)}
+            read = lambda query: self.read_sql(
+                text(query).bindparams(bindparam("ids", expanding=True)),
+                conn,
+                params=params,
+            )
+            df_lead = read("select * from `lead` where id in :ids")
+            df_deal = read("select * from deal where lead_id in :ids")
+            df_area = read(
+                "select * from area where id in (select area_id from area_deal where lead_id in :ids)"
+            )
+            df_area_deal = read("select * from area_deal where lead_id in :ids")
+            df_deal_task = read(
+                "select * from deal_task where deal_id in (select id from deal where lead_id in :ids)"
+            )
+            df_deal_comment = read(
+                "select * from deal_comment where deal_id in (select id from deal where lead_id in :ids)"
+            )
+        df_mall = self.read_sql("select * from mall", conn)
+        df_group = self.read_sql("select * from `group`", conn)
+        df_user = self.read_sql("select * from user", conn)
+        df_user_access = self.read_sql("select * from user_access", conn)
+        conn.close()
         return (
             df_lead,
             df_deal,
@@ -123,6 +575,103 @@ class LotosDashboardCron:
             df_user_access,
         )
 
+    def to_hours(self, time_used: pd.Series):
+        return [
+            i.total_seconds() / 3600 if pd.notnull(i) else np.nan for i in time_used
+        ]
+
+    def fetch_comment_summary(self, df_deal_comment: pd.DataFrame):
+        # one row per deal task: first and last comment, first contacted and first win/lose.
+        # first/last are taken in comment id order, the source's primary-key scan order
+        df_comment = df_deal_comment[["deal_id", "deal_task_id", "id", "status"]]
+        df_comment = df_comment.sort_values("id", kind="stable")
+        status = df_comment["status"]
+        df_comment = df_comment.assign(
+            contacted_id=df_comment["id"].where(status == "contacted"),
+            closed_id=df_comment["id"].where(status.isin(["win", "lose"])),
+        )
+        df_summary = df_comment.groupby(
+            ["deal_id", "deal_task_id"], as_index=False, dropna=False
+        ).agg(
+            first_comment_id=("id", "first"),
+            last_comment_id=("id", "last"),
+            first_contacted_id=("contacted_id", "first"),
+            first_closed_id=("closed_id", "first"),
+        )
+        # timestamps come from the chosen rows, "first" on created_at would skip nulls
+        created_at = df_deal_comment.set_index("id")["created_at"]
+        for event in ["comment", "contacted", "closed"]:
+            df_summary[f"first_{event}_at"] = df_summary[f"first_{event}_id"].map(
+                created_at
+            )
+        return df_summary
+
+    def fetch_base(self, data: tuple):
+        # lead -> deal -> deal_task with the comment summary, built once per cycle for both outputs
+        if self.base is not None and self.base[0] is data:
+            return self.base[1]
+        (
+            df_lead,
+            df_deal,
+            df_mall,
+            df_area,
+            df_area_deal,
+            df_group,
+            df_deal_task,
+            df_deal_comment,
+            df_user,
+            df_user_access,
+        ) = data
+
+        df_base = pd.merge(
+            df_lead.rename(
+                columns={
+                    "id": "lead_id",
+                    "created_at": "lead_created_at",
+                    "updated_at": "lead_updated_at",
+                }
+            )[["lead_id", "lead_created_at"]],
+            df_deal.rename(
+                columns={
+                    "id": "deal_id",
+                    "code": "deal_code",
+                    "created_at": "deal_created_at",
+                    "updated_at": "deal_updated_at",
+                }
+            ).drop(columns=["user_id", "loi_reference"], errors="ignore"),
+            on="lead_id",
+            how="left",
+        )
+        df_base = pd.merge(
+            df_base,
+            df_deal_task.rename(
+                columns={
+                    "group_id": "assigned_group",
+                    "created_at": "task_created_at",
+                    "due_date": "task_due_date",
+                    "id": "deal_task_id",
+                    "status": "deal_task_status",
+                    "updated_at": "task_updated_at",
+                }
+            ).drop(columns=["loi_reference"], errors="ignore"),
+            on="deal_id",
+            how="left",
+        )
+        df_base = pd.merge(
+            df_base,
+            self.fetch_comment_summary(df_deal_comment),
+            on=["deal_id", "deal_task_id"],
+            how="left",
+        )
+
+        # both outputs turn this into hours against their own start
+        df_base["first_activity_at"] = df_base["first_comment_at"].fillna(
+            df_base["task_updated_at"].where(df_base["task_status"] == "transfer")
+        )
+
+        self.base = (data, df_base)
+        return df_base
+
     def fetch_lead_insight(self, data: tuple):
         (
             df_lead,
@@ -214,121 +763,90 @@ class LotosDashboardCron:
             i.date().strftime("%A") for i in df_lead_insight["lead_created_at"]
         ]
 
-        df_lead_insight["lead_sender"] = df_lead_insight["lead_sender"].fillna("tenant")
-        df_lead_insight.loc[
-            df_lead_insight.query("lead_sender!='tenant'").index, "lead_sender"
-        ] = "employee"
+        # lead_sender is the lead's user_id, empty when the tenant sent the lead
+        df_lead_insight["lead_sender"] = np.where(
+            df_lead_insight["lead_sender"].isna(), "tenant", "employee"
+        )
+
+        mapping_format = {
+            "hypermarket": "Hypermarket",
+            "all": "All",
+            "mini_supermarket": "Mini_Supermarket",
+            "supermarket": "Supermarket",
+            "cpfm": "CPFM",
+        }
+        df_lead_insight = df_lead_insight.replace(mapping_format)
+        df_lead_insight = df_lead_insight.replace(
+            {"employee": "Employee", "tenant": "Tenant"}
+        )
 
+        df_base = self.fetch_base(data)
+        # a deal's row carries its last task and that task's last comment
         df_lead_insight = pd.merge(
             df_lead_insight,
-            df_deal_task.rename(
+            df_base.drop_duplicates(["lead_id", "deal_id"], keep="last").rename(
                 columns={
-                    "id": "deal_task_id",
-                    "due_date": "deal_task_due_date",
-                    "updated_at": "deal_task_updated_at",
+                    "deal_task_status": "status",
+                    "task_due_date": "deal_task_due_date",
+                    "task_updated_at": "deal_task_updated_at",
                 }
             )[
                 [
-                    "deal_task_id",
+                    "lead_id",
                     "deal_id",
+                    "deal_task_id",
                     "task_id",
                     "status",
                     "task_status",
                     "deal_task_due_date",
                     "deal_task_updated_at",
+                    "last_comment_id",
                 ]
             ],
-            on="deal_id",
+            on=["lead_id", "deal_id"],
             how="left",
         )
-
-        mapping_format = {
-            "hypermarket": "Hypermarket",
-            "all": "All",
-            "mini_supermarket": "Mini_Supermarket",
-            "supermarket": "Supermarket",
-            "cpfm": "CPFM",
-        }
-        df_lead_insight = df_lead_insight.replace(mapping_format)
-        df_lead_insight = df_lead_insight.replace(
-            {"employee": "Employee", "tenant": "Tenant"}
-        )
-
         df_lead_insight = pd.merge(
             df_lead_insight,
-            df_deal_comment.rename(
+            df_deal_comment.drop(columns=["deal_id", "deal_task_id"]).rename(
                 columns={
                     "created_at": "comment_created_at",
                     "status": "comment_status",
                     "id": "comment_id",
                 }
             ),
-            on=["deal_id", "deal_task_id"],
+            left_on="last_comment_id",
+            right_on="comment_id",
             how="left",
-        )
+        ).drop(columns=["last_comment_id"])
 
-        df_deal_closed = df_lead_insight.copy().query(
-            "comment_status=='win' or comment_status =='lose'"
-        )
-        df_deal_closed["deal_time_used"] = (
-            df_deal_closed["comment_created_at"] - df_deal_closed["deal_created_at"]
-        )
-        df_deal_closed["deal_time_used"] = [
-            i.total_seconds() / 3600 for i in df_deal_closed["deal_time_used"]
-        ]
-        df_deal_closed = df_deal_closed.drop_duplicates(
+        df_deal_closed = df_base.query("first_closed_id.notna()").drop_duplicates(
             ["lead_id", "deal_id"], keep="first"
+        )[["deal_id", "first_closed_at", "deal_created_at"]]
+        df_deal_closed["deal_time_used"] = self.to_hours(
+            df_deal_closed["first_closed_at"] - df_deal_closed["deal_created_at"]
         )
 
-        df_first_activity = df_lead_insight.copy().drop_duplicates(
+        df_first_activity = df_base.drop_duplicates(
             ["lead_id", "deal_id"], keep="first"
-        )
-        df_first_activity = df_first_activity.query(
-            "comment_created_at.notna() or task_status== 'transfer'"
-        )
-        df_first_activity.loc[
-            df_first_activity.query("comment_created_at.notna()").index,
-            "time_first_activity",
-        ] = (
-            df_first_activity.query("comment_created_at.notna()")["comment_created_at"]
-            - df_first_activity.query("comment_created_at.notna()")["deal_created_at"]
-        )
-        df_first_activity.loc[
-            df_first_activity.query("comment_created_at.isna()").index,
-            "time_first_activity",
-        ] = (
-            df_first_activity.query("comment_created_at.isna()")["deal_task_updated_at"]
-            - df_first_activity.query("comment_created_at.isna()")["deal_created_at"]
-        )
-        df_first_activity["time_first_activity"] = [
-            i.total_seconds() / 3600 for i in df_first_activity["time_first_activity"]
+        ).query("first_activity_at.notna()")[
+            ["deal_id", "first_activity_at", "deal_created_at"]
         ]
-
-        df_first_contacted_time = (
-            df_lead_insight.copy()
-            .query("comment_status == 'contacted'")
-            .drop_duplicates(["lead_id", "deal_id"])[
-                [
-                    "lead_id",
-                    "deal_id",
-                    "comment_status",
-                    "comment_created_at",
-                    "deal_created_at",
-                ]
-            ]
+        df_first_activity["time_first_activity"] = self.to_hours(
+            df_first_activity["first_activity_at"]
+            - df_first_activity["deal_created_at"]
         )
-        df_first_contacted_time["first_contacted_time_used"] = (
-            df_first_contacted_time["comment_created_at"]
+
+        df_first_contacted_time = df_base.query(
+            "first_contacted_id.notna()"
+        ).drop_duplicates(["lead_id", "deal_id"], keep="first")[
+            ["deal_id", "first_contacted_at", "deal_created_at"]
+        ]
+        df_first_contacted_time["first_contacted_time_used"] = self.to_hours(
+            df_first_contacted_time["first_contacted_at"]
             - df_first_contacted_time["deal_created_at"]
         )
-        df_first_contacted_time["first_contacted_time_used"] = [
-            i.total_seconds() / 3600
-            for i in df_first_contacted_time["first_contacted_time_used"]
-        ]
 
-        df_lead_insight = df_lead_insight.drop_duplicates(
-            ["lead_id", "deal_id"], keep="last"
-        )
         df_lead_insight = pd.merge(
             df_lead_insight,
             df_first_activity[["deal_id", "time_first_activity"]],
@@ -363,130 +881,46 @@ class LotosDashboardCron:
             df_user_access,
         ) = data
 
+        # loi_reference from deal, deal_task and deal_comment is not part of user_performance
         df_kpi = pd.merge(
-            df_lead.rename(
-                columns={
-                    "id": "lead_id",
-                    "created_at": "lead_created_at",
-                    "updated_at": "lead_updated_at",
-                }
-            )[["lead_id", "lead_created_at"]],
-            df_deal.rename(
-                columns={
-                    "id": "deal_id",
-                    "code": "deal_code",
-                    "created_at": "deal_created_at",
-                    "updated_at": "deal_updated_at",
-                }
-            ).drop(columns=["user_id"]),
-            on="lead_id",
-            how="left",
-        )
-        df_kpi = pd.merge(
-            df_kpi,
-            df_deal_task.rename(
-                columns={
-                    "group_id": "assigned_group",
-                    "created_at": "task_created_at",
-                    "due_date": "task_due_date",
-                    "id": "deal_task_id",
-                    "status": "deal_task_status",
-                    "updated_at": "task_updated_at",
-                }
-            ),
-            on="deal_id",
-            how="left",
-        )
-        df_kpi = pd.merge(
-            df_kpi,
+            self.fetch_base(data),
             df_deal_comment.rename(
                 columns={
                     "id": "deal_comment_id",
                     "created_at": "comment_created_at",
                     "user_id": "deal_comment_user_id",
                 }
-            ),
+            ).drop(columns=["loi_reference"], errors="ignore"),
             on=["deal_id", "deal_task_id"],
             how="left",
-        ).drop(columns=["loi_reference_x", "loi_reference_y"])
-        df_kpi.loc[
-            df_kpi.query("status=='win' or status =='lose'").index,
-            "time_close_deal_task",
-        ] = (
-            df_kpi.query("status=='win' or status =='lose'")["comment_created_at"]
-            - df_kpi.query("status=='win' or status =='lose'")["task_created_at"]
-        )
-        df_kpi.loc[
-            df_kpi.query("time_close_deal_task.notna()").index, "time_close_deal_task"
-        ] = [
-            i.total_seconds() / 3600
-            for i in df_kpi.loc[
-                df_kpi.query("time_close_deal_task.notna()").index,
-                "time_close_deal_task",
-            ]
-        ]
-
-        df_kpi_time_first_activity = df_kpi.copy().drop_duplicates(
-            ["lead_id", "deal_id", "deal_task_id"], keep="first"
         )
-        df_kpi_time_first_activity = df_kpi_time_first_activity.query(
-            "comment_created_at.notna() or task_status== 'transfer'"
+        # the comment summary names the rows that carry each task's first events
+        is_first_task_row = df_kpi["first_comment_id"].isna() | (
+            df_kpi["deal_comment_id"] == df_kpi["first_comment_id"]
+        ).fillna(False)
+        is_first_contacted = (
+            df_kpi["deal_comment_id"] == df_kpi["first_contacted_id"]
+        ).fillna(False)
+        df_kpi["closed_at"] = df_kpi["comment_created_at"].where(
+            df_kpi["status"].isin(["win", "lose"])
         )
-        df_kpi_time_first_activity.loc[
-            df_kpi_time_first_activity.query("comment_created_at.notna()").index,
-            "time_first_activity",
-        ] = (
-            df_kpi_time_first_activity.query("comment_created_at.notna()")[
-                "comment_created_at"
-            ]
-            - df_kpi_time_first_activity.query("comment_created_at.notna()")[
-                "task_created_at"
-            ]
+        df_kpi["time_close_deal_task"] = self.to_hours(
+            df_kpi["closed_at"] - df_kpi["task_created_at"]
         )
-        df_kpi_time_first_activity.loc[
-            df_kpi_time_first_activity.query("comment_created_at.isna()").index,
-            "time_first_activity",
-        ] = (
-            df_kpi_time_first_activity.query("comment_created_at.isna()")[
-                "task_updated_at"
-            ]
-            - df_kpi_time_first_activity.query("comment_created_at.isna()")[
-                "task_created_at"
-            ]
+        df_kpi["time_first_activity"] = self.to_hours(
+            df_kpi["first_activity_at"].where(is_first_task_row)
+            - df_kpi["task_created_at"]
         )
-        df_kpi_time_first_activity["time_first_activity"] = [
-            i.total_seconds() / 3600
-            for i in df_kpi_time_first_activity["time_first_activity"]
-        ]
-
-        df_kpi_time_first_contacted = (
-            df_kpi.copy()
-            .query("status=='contacted'")
-            .drop_duplicates(["lead_id", "deal_id", "deal_task_id"], keep="first")
-        )
-        df_kpi_time_first_contacted["time_first_contacted"] = (
-            df_kpi_time_first_contacted["comment_created_at"]
-            - df_kpi_time_first_contacted["task_created_at"]
+        df_kpi["time_first_contacted"] = self.to_hours(
+            df_kpi["first_contacted_at"].where(is_first_contacted)
+            - df_kpi["task_created_at"]
         )
-        df_kpi_time_first_contacted["time_first_contacted"] = [
-            i.total_seconds() / 3600
-            for i in df_kpi_time_first_contacted["time_first_contacted"]
-        ]
 
         # df_kpi_time_doing_task = df_kpi.copy().drop_duplicates(['lead_id','deal_id','task_id'],keep='last')
         df_kpi_time_doing_task = df_kpi.copy()
-        df_kpi_time_doing_task.loc[
-            df_kpi_time_doing_task.query("status=='win' or status == 'lose'").index,
-            "time_doing_task",
-        ] = (
-            df_kpi_time_doing_task.loc[
-                df_kpi_time_doing_task.query("status=='win' or status == 'lose'").index,
-                "comment_created_at",
-            ]
-            - df_kpi_time_doing_task.loc[
-                df_kpi_time_doing_task.query("status=='win' or status == 'lose'").index,
-                "task_created_at",
-            ]
+        df_kpi_time_doing_task["time_doing_task"] = (
+            df_kpi_time_doing_task["closed_at"]
+            - df_kpi_time_doing_task["task_created_at"]
         )
         df_kpi_time_doing_task_get_last = df_kpi_time_doing_task.copy().drop_duplicates(
             ["lead_id", "deal_id", "task_id"], keep="last"
@@ -511,12 +945,6 @@ class LotosDashboardCron:
             "time_doing_task"
         ].apply(lambda x: x.total_seconds() / 3600 if pd.notnull(x) else np.nan)
 
-        df_kpi.loc[df_kpi_time_first_activity.index, "time_first_activity"] = (
-            df_kpi_time_first_activity["time_first_activity"]
-        )
-        df_kpi.loc[df_kpi_time_first_contacted.index, "time_first_contacted"] = (
-            df_kpi_time_first_contacted["time_first_contacted"]
-        )
         df_kpi.loc[df_kpi_time_doing_task.index, "time_doing_task"] = (
             df_kpi_time_doing_task["time_doing_task"]
         )
@@ -559,7 +987,7 @@ class LotosDashboardCron:
         )
 
         df_user_respond = df_user_respond.groupby(
-            ["group_id", "group_name", "code", "type"], as_index=False
+            ["group_id", "group_name", "code", "type"], as_index=False, observed=True
         ).agg(
             {
                 "username": list,
@@ -657,6 +1085,15 @@ class LotosDashboardCron:
             "role",
             "user_id",
             "state_flows",
+            "first_comment_id",
+            "last_comment_id",
+            "first_comment_at",
+            "first_contacted_id",
+            "first_contacted_at",
+            "first_closed_id",
+            "first_closed_at",
+            "first_activity_at",
+            "closed_at",
         ]
         df_kpi_performance_user = df_kpi_performance_user.drop(columns=columns_drop)
         return df_kpi_performance_user
@@ -0,0 +1,47 @@
+import os
+from datetime import datetime
+
+import pandas as pd, pyarrow as pa
+from pyarrow import feather
+
+LATEST = "latest.arrow"
+
+
+def write_frame(directory: str, name: str, df: pd.DataFrame, keep: int = 5):
+    """Writes df as <directory>/<name>/<version>.arrow and points latest.arrow at it.
+
+    Files are uncompressed Arrow IPC so readers can memory-map them without a copy.
+    The newest keep versions stay on disk, the one latest.arrow points at always does.
+    """
+    table_dir = os.path.join(directory, name)
+    os.makedirs(table_dir, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(table_dir, f"{version}.arrow")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    feather.write_feather(table, f"{path}.tmp", compression="uncompressed")
+    os.replace(f"{path}.tmp", path)
+
+    # swap the symlink in one rename, readers never see it missing
+    link = os.path.join(table_dir, LATEST)
+    if os.path.lexists(f"{link}.tmp"):
+        os.remove(f"{link}.tmp")
+    os.symlink(os.path.basename(path), f"{link}.tmp")
+    os.replace(f"{link}.tmp", link)
+
+    # open memory maps keep working after the unlink
+    versions = sorted(
+        file
+        for file in os.listdir(table_dir)
+        if file.endswith(".arrow") and file != LATEST
+    )
+    for file in versions[: -max(keep, 1)]:
+        os.remove(os.path.join(table_dir, file))
+    return path
+
+
+def read_latest(directory: str, name: str):
+    """Memory-maps the latest export of name, returns a pyarrow Table."""
+    path = os.path.realpath(os.path.join(directory, name, LATEST))
+    # the table's buffers point into the map, so it stays open with them
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all()
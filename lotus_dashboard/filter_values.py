@@ -0,0 +1,87 @@
+import pandas as pd
+from sqlalchemy import func, literal, select, union_all
+
+# dataset -> (timestamp behind last_seen_at, columns used as dashboard native filters)
+FILTER_COLUMNS = {
+    "lead_insight": (
+        "lead_created_at",
+        [
+            "mall_name",
+            "mall_type",
+            "mall_region",
+            "province",
+            "type",
+            "category",
+            "store_format",
+            "source",
+            "brand_type",
+            "rent_type",
+            "size_range",
+            "lead_sender",
+            "status",
+            "task_status",
+            "comment_status",
+        ],
+    ),
+    "user_performance": (
+        "task_created_at",
+        [
+            "group_name",
+            "code",
+            "type",
+            "region",
+            "area_code",
+            "province",
+            "loi_status",
+            "deal_task_status",
+            "task_status",
+            "status",
+            "user_comment_first_last",
+        ],
+    ),
+}
+
+
+def build_filter_values(dataset: str, df: pd.DataFrame):
+    """Distinct values of each filter column with their row count and last activity.
+
+    NULL is kept as its own value, as GROUP BY does in filter_values_statement.
+    """
+    timestamp, columns = FILTER_COLUMNS[dataset]
+    frames = []
+    for column in columns:
+        if column not in df.columns:
+            continue
+        df_values = (
+            df[[column, timestamp]]
+            .groupby(column, observed=True, dropna=False)
+            .agg(row_count=(timestamp, "size"), last_seen_at=(timestamp, "max"))
+            .reset_index()
+            .rename(columns={column: "value"})
+        )
+        df_values["value"] = df_values["value"].astype("string[pyarrow]")
+        df_values.insert(0, "column_name", column)
+        frames.append(df_values)
+    if not frames:
+        return pd.DataFrame(
+            columns=["column_name", "value", "row_count", "last_seen_at"]
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def filter_values_statement(model):
+    """The same values grouped in the database, for tables updated in place."""
+    table = model.__table__
+    timestamp, columns = FILTER_COLUMNS[table.name]
+    return union_all(
+        *[
+            select(
+                literal(column).label("column_name"),
+                table.c[column].label("value"),
+                func.count().label("row_count"),
+                func.max(table.c[timestamp]).label("last_seen_at"),
+            ).group_by(table.c[column])
+            for column in columns
+            if column in table.c
+        ]
+    )
@@ -1,2 +1,5 @@
 from .lead_insight import LeadInsight
 from .user_performance import UserPerformance
+from .user_performance_sketch import UserPerformanceSketch
+from .lead_insight_filter import LeadInsightFilter
+from .user_performance_filter import UserPerformanceFilter
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from lotus_dashboard.database import Base
+
+
+class LeadInsightFilter(Base):
+    __tablename__ = "lead_insight_filter"
+
+    id = Column(Integer, primary_key=True)
+    column_name = Column(String(255), index=True)
+    value = Column(String(255), index=True)
+    row_count = Column(Integer)
+    last_seen_at = Column(DateTime, index=True)
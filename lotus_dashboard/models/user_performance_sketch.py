@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Date, Integer, LargeBinary, String
+from lotus_dashboard.database import Base
+
+
+class UserPerformanceSketch(Base):
+    __tablename__ = "user_performance_sketch"
+
+    id = Column(Integer, primary_key=True)
+    metric = Column(String(255), index=True)
+    day = Column(Date, index=True)
+    assigned_group = Column(Integer, index=True)
+    group_name = Column(String(255), index=True)
+    code = Column(String(255), index=True)
+    count = Column(Integer)
+    sketch = Column(LargeBinary)
@@ -0,0 +1,137 @@
+import cProfile, os, pstats, sys, threading, time, tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# before 3.12 cProfile only sees the thread that enabled it, from 3.12 it hooks
+# sys.monitoring for every thread and refuses a second active profiler
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+
+class CycleProfiler:
+    """Profiles one cron cycle on request: cProfile, sampled stacks and tracemalloc per stage."""
+
+    def __init__(self, directory: str, top: int = 10, interval: float = 0.005) -> None:
+        self.directory = directory
+        self.top = top
+        self.interval = interval
+        self.requested = False
+        self.active = False
+        self.lock = threading.Lock()
+
+    def request(self, *args):
+        # also used as the signal handler, the next cycle picks it up
+        self.requested = True
+
+    @contextmanager
+    def cycle(self):
+        if not self.requested:
+            yield
+            return
+        self.requested = False
+        self.active = True
+        self.thread = threading.current_thread()
+        self.profiles = []
+        self.allocations = []
+        self.stacks = Counter()
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(25)
+        sampling = threading.Event()
+        sampler = threading.Thread(target=self.sample, args=(sampling,), daemon=True)
+        sampler.start()
+        profile = cProfile.Profile()
+        started_at = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started_at
+            sampling.set()
+            sampler.join()
+            self.active = False
+            if started_tracemalloc:
+                tracemalloc.stop()
+            self.profiles.append(profile)
+            self.dump(elapsed)
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.active:
+            yield
+            return
+        before = tracemalloc.take_snapshot()
+        # the writer thread gets its own profile where the cycle's can't see it
+        profile = None
+        if PROFILE_PER_THREAD and threading.current_thread() is not self.thread:
+            profile = cProfile.Profile()
+            profile.enable()
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            if profile is not None:
+                profile.disable()
+            after = tracemalloc.take_snapshot()
+            stats = self.own_filtered(after).compare_to(
+                self.own_filtered(before), "lineno"
+            )[: self.top]
+            with self.lock:
+                if profile is not None:
+                    self.profiles.append(profile)
+                self.allocations.append((name, elapsed, stats))
+
+    def own_filtered(self, snapshot: tracemalloc.Snapshot):
+        return snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ]
+        )
+
+    def sample(self, stop: threading.Event):
+        own = threading.get_ident()
+        names = {}
+        while not stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = os.path.basename(code.co_filename)
+                    stack.append(f"{code.co_name} ({name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, elapsed: float):
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(
+            self.directory, f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        )
+
+        stats = pstats.Stats(*self.profiles)
+        stats.dump_stats(f"{prefix}.pstats")
+        with open(f"{prefix}.txt", "w", encoding="utf-8") as f:
+            f.write(f"cycle took {elapsed:.2f}s\n")
+            stats.stream = f
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(100)
+
+        # collapsed stacks, feed to flamegraph.pl or speedscope
+        with open(f"{prefix}.collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(f"{prefix}.alloc.txt", "w", encoding="utf-8") as f:
+            # loads overlap with the transforms, their snapshots share allocations
+            for name, stage_elapsed, stage_stats in self.allocations:
+                f.write(f"== {name} ({stage_elapsed:.2f}s)\n")
+                for stat in stage_stats:
+                    f.write(f"{stat}\n")
+                f.write("\n")
+        print("Profile written to", prefix, datetime.now())
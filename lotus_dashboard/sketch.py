@@ -0,0 +1,93 @@
+import pandas as pd
+from datasketches import kll_floats_sketch
+from sqlalchemy import select
+
+from lotus_dashboard.models.user_performance_sketch import UserPerformanceSketch
+
+SKETCH_METRICS = ["time_first_activity", "time_first_contacted", "time_doing_task"]
+SKETCH_KEYS = ["assigned_group", "group_name", "code", "day"]
+SKETCH_K = 200
+
+
+def sketch_rows(df_user_performance: pd.DataFrame):
+    # exploded assignees repeat the task's row, count every comment row once
+    df = df_user_performance.drop_duplicates(["deal_task_id", "deal_comment_id"])
+    df = df.assign(day=df["task_created_at"].astype("date32[pyarrow]"))
+    return df[SKETCH_KEYS + SKETCH_METRICS]
+
+
+def fingerprint_days(df_rows: pd.DataFrame):
+    """Order independent hash of each day's sketch rows, a changed hash means a changed day."""
+    hashes = pd.util.hash_pandas_object(df_rows, index=False)
+    # uint64 sums wrap, that is fine for a fingerprint
+    return hashes.groupby(df_rows["day"]).sum()
+
+
+def build_sketches(df_rows: pd.DataFrame, days=None):
+    """One KLL sketch per metric x assigned_group x mall code x task day."""
+    if days is not None:
+        df_rows = df_rows[df_rows["day"].isin(days)]
+    rows = []
+    for metric in SKETCH_METRICS:
+        values = df_rows[SKETCH_KEYS + [metric]].dropna(subset=[metric])
+        for (assigned_group, group_name, code, day), group in values.groupby(
+            SKETCH_KEYS, dropna=False, observed=True
+        ):
+            sketch = kll_floats_sketch(SKETCH_K)
+            sketch.update(group[metric].to_numpy(dtype="float32"))
+            rows.append(
+                {
+                    "metric": metric,
+                    "day": day,
+                    "assigned_group": assigned_group,
+                    "group_name": group_name,
+                    "code": code,
+                    "count": sketch.n,
+                    "sketch": sketch.serialize(),
+                }
+            )
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "metric",
+            "day",
+            "assigned_group",
+            "group_name",
+            "code",
+            "count",
+            "sketch",
+        ],
+    )
+
+
+def merge_sketches(sketches):
+    merged = kll_floats_sketch(SKETCH_K)
+    for sketch in sketches:
+        merged.merge(kll_floats_sketch.deserialize(sketch))
+    return merged
+
+
+def query_percentiles(
+    conn,
+    metric: str,
+    start,
+    end,
+    assigned_group: int = None,
+    code: str = None,
+    quantiles=(0.5, 0.9, 0.99),
+):
+    """Percentiles of metric over [start, end], merged from the stored daily sketches."""
+    statement = select(UserPerformanceSketch.sketch).where(
+        UserPerformanceSketch.metric == metric,
+        UserPerformanceSketch.day.between(start, end),
+    )
+    if assigned_group is not None:
+        statement = statement.where(
+            UserPerformanceSketch.assigned_group == assigned_group
+        )
+    if code is not None:
+        statement = statement.where(UserPerformanceSketch.code == code)
+    merged = merge_sketches(row[0] for row in conn.execute(statement))
+    if merged.is_empty():
+        return {q: None for q in quantiles}
+    return dict(zip(quantiles, merged.get_quantiles(list(quantiles))))
@@ -0,0 +1,279 @@
+from datetime import datetime
+import argparse, getpass, json, os, shutil, subprocess, tempfile, time
+
+import numpy as np, pandas as pd, pymysql
+from sqlalchemy import (
+    Boolean,
+    Date,
+    DateTime,
+    DECIMAL,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    text,
+)
+
+from lotus_dashboard.models.lead_insight import LeadInsight
+from lotus_dashboard.models.user_performance import UserPerformance
+
+MODELS = {"lead_insight": LeadInsight, "user_performance": UserPerformance}
+
+
+class LocalMySQL:
+    """Throwaway mysqld/mariadbd in a temp datadir, reachable over a unix socket."""
+
+    def __init__(self, binary: str = None) -> None:
+        self.binary = (
+            binary
+            or shutil.which("mariadbd")
+            or shutil.which("mysqld")
+            or shutil.which("mysqld", path="/usr/sbin")
+        )
+        if self.binary is None:
+            raise RuntimeError("no mysqld or mariadbd found, pass --mysqld or --config")
+        self.datadir = tempfile.mkdtemp(prefix="lotus-bench-")
+        self.socket = os.path.join(self.datadir, "mysqld.sock")
+        self.process = None
+
+    def start(self):
+        data = os.path.join(self.datadir, "data")
+        os.makedirs(data)
+        user = ["--user", getpass.getuser()] if os.geteuid() == 0 else []
+        install_db = shutil.which("mariadb-install-db") or shutil.which(
+            "mysql_install_db"
+        )
+        if "mariadb" in os.path.realpath(self.binary) and install_db:
+            subprocess.run(
+                [
+                    install_db,
+                    "--no-defaults",
+                    f"--datadir={data}",
+                    "--auth-root-authentication-method=normal",
+                    "--skip-test-db",
+                    *user,
+                ],
+                check=True,
+                capture_output=True,
+            )
+        else:
+            subprocess.run(
+                [
+                    self.binary,
+                    "--no-defaults",
+                    "--initialize-insecure",
+                    f"--datadir={data}",
+                    *user,
+                ],
+                check=True,
+                capture_output=True,
+            )
+        self.process = subprocess.Popen(
+            [
+                self.binary,
+                "--no-defaults",
+                f"--datadir={data}",
+                f"--socket={self.socket}",
+                f"--pid-file={os.path.join(self.datadir, 'mysqld.pid')}",
+                f"--log-error={os.path.join(self.datadir, 'error.log')}",
+                "--skip-networking",
+                "--innodb-buffer-pool-size=512M",
+                *user,
+            ]
+        )
+        deadline = time.time() + 60
+        while True:
+            try:
+                pymysql.connect(user="root", unix_socket=self.socket).close()
+                return
+            except pymysql.err.OperationalError:
+                if time.time() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise RuntimeError(f"mysqld did not start, see {self.datadir}")
+                time.sleep(0.5)
+
+    def create_database(self, name: str):
+        conn = pymysql.connect(user="root", unix_socket=self.socket)
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{name}`")
+            cursor.execute(f"CREATE DATABASE `{name}` CHARACTER SET utf8mb4")
+        conn.close()
+        return {
+            "MYSQL_DB": name,
+            "MYSQL_HOST": "localhost",
+            "MYSQL_USER": "root",
+            "MYSQL_PASSWORD": "",
+            "MYSQL_PARAMS": f"?charset=utf8mb4&unix_socket={self.socket}",
+        }
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(60)
+        shutil.rmtree(self.datadir, ignore_errors=True)
+
+
+def make_frame(model, rows: int, seed: int = 0):
+    # output-shaped rows, strings drawn from a small vocabulary like the real dimensions
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-01-01")
+    vocabulary = np.array([f"value_{i}" for i in range(50)])
+    data = {}
+    for column in model.__table__.c:
+        if column.primary_key:
+            continue
+        kind = column.type
+        if isinstance(kind, Boolean):
+            data[column.name] = rng.random(rows) < 0.5
+        elif isinstance(kind, Integer):
+            data[column.name] = rng.integers(1, 100_000, rows)
+        elif isinstance(kind, DECIMAL):
+            data[column.name] = np.round(rng.random(rows) * 1000, 6)
+        elif isinstance(kind, DateTime):
+            data[column.name] = start + pd.to_timedelta(
+                rng.integers(0, 365 * 24 * 3600, rows), unit="s"
+            )
+        elif isinstance(kind, Date):
+            data[column.name] = (
+                start + pd.to_timedelta(rng.integers(0, 365, rows), unit="D")
+            ).date
+        elif isinstance(kind, Text):
+            data[column.name] = rng.choice(vocabulary, rows).astype(object) + " comment"
+        elif isinstance(kind, String):
+            data[column.name] = rng.choice(vocabulary, rows)
+        elif isinstance(kind, LargeBinary):
+            data[column.name] = [b"\x00" * 64] * rows
+    return pd.DataFrame(data)
+
+
+def drop_table(cron, model):
+    with cron.get_local_engine().begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS `{model.__tablename__}`"))
+
+
+def create_table(cron, model):
+    # what init_db does for this table: the CREATE TABLE with its indexes
+    model.__table__.create(bind=cron.get_local_engine())
+
+
+def truncate_table(cron, model):
+    with cron.get_local_engine().begin() as conn:
+        conn.execute(text(f"TRUNCATE TABLE `{model.__tablename__}`"))
+
+
+def drop_indexes(cron, model):
+    with cron.get_local_engine().begin() as conn:
+        for index in model.__table__.indexes:
+            conn.execute(text(f"DROP INDEX `{index.name}` ON `{model.__tablename__}`"))
+
+
+def table_size(cron, model):
+    with cron.get_local_engine().begin() as conn:
+        conn.execute(text(f"ANALYZE TABLE `{model.__tablename__}`"))
+        return conn.execute(
+            text(
+                "select data_length, index_length from information_schema.tables "
+                "where table_schema = database() and table_name = :table"
+            ),
+            {"table": model.__tablename__},
+        ).fetchone()
+
+
+def timed(function, *args):
+    started_at = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started_at
+
+
+def run(config_path: str, args):
+    from lotus_cron import LotosDashboardCron
+
+    cron = LotosDashboardCron(config_path)
+    results = []
+    for indexes in args.indexes:
+        for model_name in args.models:
+            model = MODELS[model_name]
+            for rows in args.rows:
+                df = make_frame(model, rows)
+                for strategy in args.strategies:
+                    drop_seconds = timed(drop_table, cron, model)
+                    create_seconds = timed(create_table, cron, model)
+                    if indexes == "none":
+                        drop_indexes(cron, model)
+                    cron.config["LOAD_PARALLELISM"] = (
+                        args.parallelism if strategy == "parallel" else 1
+                    )
+                    if strategy == "csv":
+                        with tempfile.NamedTemporaryFile(suffix=".csv") as f:
+                            df.to_csv(f.name, index=False)
+                            seconds = timed(cron.import_csv_to_db, model, f.name)
+                    else:
+                        seconds = timed(cron.dataframe_to_db, model, df.copy())
+                    data_length, index_length = table_size(cron, model)
+                    truncate_seconds = timed(truncate_table, cron, model)
+                    result = {
+                        "table": model_name,
+                        "indexes": indexes,
+                        "strategy": strategy,
+                        "rows": rows,
+                        "seconds": round(seconds, 3),
+                        "rows_per_second": round(rows / seconds),
+                        "data_mb": round(data_length / 2**20, 2),
+                        "index_mb": round(index_length / 2**20, 2),
+                        "drop_table_seconds": round(drop_seconds, 3),
+                        "create_table_seconds": round(create_seconds, 3),
+                        "truncate_seconds": round(truncate_seconds, 3),
+                    }
+                    results.append(result)
+                    print(json.dumps(result), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Times full refresh loads of the dashboard tables."
+    )
+    parser.add_argument(
+        "--config",
+        help="cron config of a scratch database, its tables are dropped; "
+        "default starts a local server",
+    )
+    parser.add_argument("--mysqld", help="mysqld or mariadbd binary to start")
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000]
+    )
+    parser.add_argument(
+        "--models", nargs="+", choices=list(MODELS), default=list(MODELS)
+    )
+    parser.add_argument(
+        "--indexes", nargs="+", choices=["model", "none"], default=["model", "none"]
+    )
+    parser.add_argument(
+        "--strategies",
+        nargs="+",
+        choices=["bulk", "parallel", "csv"],
+        default=["bulk", "parallel"],
+    )
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--output", help="also write the results to this csv")
+    args = parser.parse_args()
+
+    server = None
+    config_path = args.config
+    try:
+        if config_path is None:
+            server = LocalMySQL(args.mysqld)
+            server.start()
+            config_path = os.path.join(server.datadir, "config-bench.json")
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump(server.create_database("lotus_dashboard_bench"), f)
+        results = run(config_path, args)
+    finally:
+        if server is not None:
+            server.stop()
+
+    df_results = pd.DataFrame(results)
+    print(df_results.to_string(index=False))
+    if args.output:
+        df_results.to_csv(args.output, index=False)
+    print("Benchmark finished", datetime.now())
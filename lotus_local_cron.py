@@ -6,7 +6,8 @@ if __name__ == "__main__":
     from lotus_cron import LotosDashboardCron
 
     cron = LotosDashboardCron("config-local.json")
+    interval = cron.config.get("CRON_INTERVAL", 60)
     while True:
-        cron.fetch()
-        print("Sleeping for 60 seconds", datetime.now())
-        time.sleep(60)
+        cron.refresh()
+        print(f"Sleeping for {interval} seconds", datetime.now())
+        time.sleep(interval)
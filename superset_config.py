@@ -3,6 +3,8 @@ import json, os
 env = os.getenv("SUPERSET_ENV", "development")
 if env == "development":
     env_file = "config-local.json"
+elif env == "production":
+    env_file = os.getenv("SUPERSET_CONFIG_JSON", "config-prod.json")
 else:
     assert False
 
@@ -0,0 +1,84 @@
+import importlib.util, os
+from urllib.parse import urlparse
+
+from cachelib.redis import RedisCache
+
+# superset loads SUPERSET_CONFIG_PATH as the module superset_config, so
+# `from superset_config import *` would import this file itself; load the shared
+# settings from their file under another name instead
+spec = importlib.util.spec_from_file_location(
+    "superset_config_shared",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "superset_config.py"),
+)
+shared = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(shared)
+globals().update(
+    {name: value for name, value in vars(shared).items() if name.isupper()}
+)
+config_json = shared.config_json
+
+# same Redis as CACHE_CONFIG, the celery broker, celery results and sql lab results get their own db
+REDIS_URL = config_json.get("REDIS_URL", CACHE_CONFIG["CACHE_REDIS_URL"])
+redis_url = urlparse(REDIS_URL)
+REDIS_HOST = redis_url.hostname or "localhost"
+REDIS_PORT = redis_url.port or 6379
+REDIS_PASSWORD = redis_url.password or ""
+REDIS_CELERY_DB = config_json.get("REDIS_CELERY_DB", 1)
+REDIS_RESULTS_DB = config_json.get("REDIS_RESULTS_DB", 2)
+REDIS_CELERY_RESULTS_DB = config_json.get("REDIS_CELERY_RESULTS_DB", 3)
+REDIS_BASE_URL = f"{redis_url.scheme}://{redis_url.netloc}"
+
+
+class CeleryConfig:
+    broker_url = f"{REDIS_BASE_URL}/{REDIS_CELERY_DB}"
+    result_backend = f"{REDIS_BASE_URL}/{REDIS_CELERY_RESULTS_DB}"
+    imports = ("superset.sql_lab", "superset.tasks.scheduler")
+    worker_prefetch_multiplier = 1
+    task_acks_late = True
+    task_annotations = {
+        "sql_lab.get_sql_results": {"rate_limit": "100/s"},
+    }
+
+
+CELERY_CONFIG = CeleryConfig
+
+RESULTS_BACKEND = RedisCache(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    password=REDIS_PASSWORD or None,
+    db=REDIS_RESULTS_DB,
+    key_prefix="superset_results",
+)
+
+FEATURE_FLAGS = {
+    **FEATURE_FLAGS,
+    "GLOBAL_ASYNC_QUERIES": True,
+}
+
+GLOBAL_ASYNC_QUERIES_REDIS_CONFIG = {
+    "host": REDIS_HOST,
+    "port": REDIS_PORT,
+    "password": REDIS_PASSWORD,
+    "db": int(redis_url.path.strip("/") or 0),
+    "ssl": redis_url.scheme == "rediss",
+}
+GLOBAL_ASYNC_QUERIES_REDIS_STREAM_PREFIX = "async-events-"
+GLOBAL_ASYNC_QUERIES_TRANSPORT = "polling"
+GLOBAL_ASYNC_QUERIES_POLLING_DELAY = 500
+# needs at least 32 bytes
+GLOBAL_ASYNC_QUERIES_JWT_SECRET = config_json.get(
+    "GLOBAL_ASYNC_QUERIES_JWT_SECRET", SECRET_KEY
+)
+# embedded dashboards load in a cross-site iframe, the browser only keeps the
+# async token cookie there with SameSite=None, which in turn needs Secure (HTTPS)
+GLOBAL_ASYNC_QUERIES_JWT_COOKIE_SECURE = True
+GLOBAL_ASYNC_QUERIES_JWT_COOKIE_SAMESITE = "None"
+
+# heavy user_performance charts fail fast instead of holding a worker,
+# gunicorn --timeout matches the webserver timeout, sync SQL Lab stays under it
+SUPERSET_WEBSERVER_TIMEOUT = 120
+SQLLAB_TIMEOUT = SUPERSET_WEBSERVER_TIMEOUT - 10
+SQLLAB_ASYNC_TIME_LIMIT_SEC = 60 * 10
+ROW_LIMIT = 50000
+SQL_MAX_ROW = 100000
+SAMPLES_ROW_LIMIT = 1000
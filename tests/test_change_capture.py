@@ -0,0 +1,341 @@
+import json, re, sqlite3
+from datetime import date
+
+import numpy as np, pandas as pd, pyarrow as pa
+from sqlalchemy import DATE, TIMESTAMP, create_engine
+
+from lotus_cron import LotosDashboardCron
+from lotus_dashboard.change_capture import FileChangeSource
+from lotus_dashboard.export import read_latest
+from lotus_dashboard.sketch import merge_sketches
+
+
+class SqliteCron(LotosDashboardCron):
+    # source and dashboard tables in sqlite, TRUNCATE is the only MySQL-only statement
+    def get_local_engine(self):
+        if self.local_engine is None:
+            # loads run on the writer thread
+            self.local_engine = create_engine(
+                f"sqlite:///{self.config['LOCAL_DB']}",
+                connect_args={"check_same_thread": False},
+            )
+        return self.local_engine
+
+    def get_server_engine(self):
+        if self.server_engine is None:
+            self.server_engine = create_engine(
+                f"sqlite:///{self.config['SOURCE_DB']}",
+                connect_args={"detect_types": sqlite3.PARSE_DECLTYPES},
+            )
+        return self.server_engine
+
+    def dataframe_to_records(self, df):
+        # DATE columns read back as ISO strings, MySQL takes them but sqlite's Date wants dates
+        records = super().dataframe_to_records(df)
+        for record in records:
+            for key, value in record.items():
+                if isinstance(value, str) and re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+                    record[key] = date.fromisoformat(value)
+        return records
+
+    def dataframe_to_db(self, model, df):
+        records = self.dataframe_to_records(df)
+        sess = self.get_session()
+        sess.query(model).delete()
+        sess.bulk_insert_mappings(model, records)
+        sess.commit()
+        sess.close()
+
+
+def make_source(n_lead=60, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-01-01")
+    timestamps = lambda n: start + pd.to_timedelta(
+        rng.integers(0, 90 * 24 * 3600, n), unit="s"
+    )
+    lead = pd.DataFrame(
+        {
+            "id": np.arange(1, n_lead + 1),
+            "user_id": np.where(
+                rng.random(n_lead) < 0.5, rng.integers(1, 20, n_lead), np.nan
+            ),
+            "category": rng.choice(["food", "fashion"], n_lead),
+            "store_format": rng.choice(["hypermarket", "all", "cpfm"], n_lead),
+            "source": rng.choice(["web", "line"], n_lead),
+            "brand_type": rng.choice(["local", "chain"], n_lead),
+            "rent_type": rng.choice(["short", "long"], n_lead),
+            "size_range": rng.choice(["s", "m", "l"], n_lead),
+            "created_at": timestamps(n_lead),
+            "updated_at": timestamps(n_lead),
+        }
+    )
+    n_deal = int(n_lead * 0.8)
+    deal = pd.DataFrame(
+        {
+            "id": np.arange(1, n_deal + 1),
+            "lead_id": rng.choice(lead["id"], n_deal, replace=False),
+            "code": [f"D{i}" for i in range(n_deal)],
+            "user_id": rng.integers(1, 20, n_deal),
+            "state": rng.integers(0, 5, n_deal),
+            "loi_status": rng.choice(["draft", "signed"], n_deal),
+            "group_id": rng.integers(1, 10, n_deal),
+            "loi_reference": rng.choice(["x", None], n_deal),
+            "state_flows": "[]",
+        }
+    )
+    deal["created_at"] = lead.set_index("id").loc[
+        deal["lead_id"], "created_at"
+    ].values + pd.to_timedelta(rng.integers(0, 24 * 3600, n_deal), unit="s")
+    deal["updated_at"] = deal["created_at"] + pd.Timedelta("1D")
+    n_task = n_deal * 3
+    task_deals = rng.choice(deal["id"], n_task)
+    deal_task = pd.DataFrame(
+        {
+            "id": np.arange(1, n_task + 1),
+            "deal_id": task_deals,
+            "task_id": rng.integers(1, 15, n_task),
+            "group_id": rng.integers(1, 10, n_task),
+            "task_group_id": rng.integers(1, 5, n_task),
+            "status": rng.choice(["new", "doing", "done"], n_task),
+            "task_status": rng.choice(["active", "transfer", "expired"], n_task),
+            "due_date": timestamps(n_task).date,
+            "loi_reference": rng.choice(["y", None], n_task),
+        }
+    )
+    deal_task["created_at"] = deal.set_index("id").loc[
+        task_deals, "created_at"
+    ].values + pd.to_timedelta(rng.integers(0, 48 * 3600, n_task), unit="s")
+    deal_task["updated_at"] = deal_task["created_at"] + pd.to_timedelta(
+        rng.integers(0, 48 * 3600, n_task), unit="s"
+    )
+    n_comment = n_task * 4
+    tasks = rng.choice(deal_task.index, n_comment)
+    deal_comment = pd.DataFrame(
+        {
+            "id": np.arange(1, n_comment + 1),
+            "deal_id": deal_task["deal_id"].values[tasks],
+            "deal_task_id": deal_task["id"].values[tasks],
+            "user_id": rng.integers(1, 20, n_comment),
+            "text": "hello",
+            "loi_reference": rng.choice(["c", None], n_comment),
+            "status": rng.choice(
+                ["contacted", "note", "win", "lose", "meeting"],
+                n_comment,
+                p=[0.3, 0.4, 0.05, 0.05, 0.2],
+            ),
+            "created_at": deal_task["created_at"].values[tasks]
+            + pd.to_timedelta(rng.integers(0, 72 * 3600, n_comment), unit="s"),
+        }
+    )
+    mall = pd.DataFrame(
+        {
+            "id": range(1, 6),
+            "code": [f"M{i}" for i in range(1, 6)],
+            "name": [f"mall{i}" for i in range(1, 6)],
+            "province": ["bkk", "cm", None, "pk", "kk"],
+            "type": "hyper",
+            "region": ["c", "n", "s", "s", "ne"],
+            "district": "d",
+            "area_code": ["a1", "a2", "a3", "a4", "a5"],
+        }
+    )
+    area = pd.DataFrame(
+        {
+            "id": range(1, 21),
+            "type": rng.choice(["in", "out"], 20),
+            "province": rng.choice(["bkk", None], 20),
+        }
+    )
+    area_deals = deal.sample(frac=0.7, random_state=1)
+    area_deal = pd.DataFrame(
+        {
+            "id": range(1, len(area_deals) + 1),
+            "area_id": rng.integers(1, 21, len(area_deals)),
+            "lead_id": area_deals["lead_id"].values,
+            "deal_id": area_deals["id"].values,
+            "mall_id": rng.integers(1, 6, len(area_deals)),
+        }
+    )
+    group = pd.DataFrame(
+        {
+            "id": range(1, 10),
+            "name": [f"g{i}" for i in range(1, 10)],
+            "code": [f"M{i % 6}" for i in range(1, 10)],
+            "type": rng.choice(["mall", "hq"], 9),
+        }
+    )
+    user = pd.DataFrame(
+        {
+            "id": range(1, 20),
+            "username": [f"u{i}" for i in range(1, 20)],
+            "first_name": [f"f{i}" for i in range(1, 20)],
+            "last_name": "l",
+            "last_active_date": pd.Timestamp("2024-03-01").date(),
+            "created_at": start,
+        }
+    )
+    user_access = pd.DataFrame(
+        {
+            "id": range(1, 31),
+            "user_id": rng.integers(1, 20, 30),
+            "group_id": rng.integers(1, 10, 30),
+            "role": rng.choice(["staff", "hq_manager", "area_manager"], 30),
+        }
+    )
+    return {
+        "lead": lead,
+        "deal": deal,
+        "mall": mall,
+        "area": area,
+        "area_deal": area_deal,
+        "group": group,
+        "deal_task": deal_task,
+        "deal_comment": deal_comment,
+        "user": user,
+        "user_access": user_access,
+    }
+
+
+def write_source(engine, tables: dict):
+    for name, df in tables.items():
+        # declared types let sqlite3 hand back datetime/date like pymysql does
+        dtype = {
+            column: TIMESTAMP if column.endswith("_at") else DATE
+            for column in df.columns
+            if column.endswith("_at") or column.endswith("_date")
+        }
+        df.to_sql(name, engine, if_exists="replace", index=False, dtype=dtype)
+
+
+def make_cron(tmp_path, name: str):
+    config = {
+        "SOURCE_DB": str(tmp_path / "source.db"),
+        "LOCAL_DB": str(tmp_path / f"{name}.db"),
+        "CHANGE_CAPTURE": {"SOURCE": "file", "PATH": str(tmp_path / "changes.jsonl")},
+        "EXPORT_DIR": str(tmp_path / "export" / name),
+    }
+    path = tmp_path / f"config-{name}.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return SqliteCron(str(path))
+
+
+def read_table(cron, table: str):
+    df = pd.read_sql(f"select * from {table}", cron.get_local_engine())
+    df = df.drop(columns="id").astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def read_export(cron, table: str):
+    exported = read_latest(cron.config["EXPORT_DIR"], table)
+    df = exported.to_pandas()
+    for field in exported.schema:
+        # a full export has the fetched frame's floats, one read back from the table
+        # has its ints and DECIMAL(10, 6)s
+        if (
+            pa.types.is_integer(field.type)
+            or pa.types.is_floating(field.type)
+            or pa.types.is_decimal(field.type)
+        ):
+            df[field.name] = pd.to_numeric(df[field.name]).astype(float).round(6)
+    df = df.astype(object)
+    # nulls print as nan or <NA> depending on the column's arrow type
+    df = df.where(df.notna(), None).astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def read_sketches(cron):
+    df = pd.read_sql("select * from user_performance_sketch", cron.get_local_engine())
+    df["median"] = [
+        round(merge_sketches([sketch]).get_quantile(0.5), 3) for sketch in df["sketch"]
+    ]
+    df = df.drop(columns=["id", "sketch"]).astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_incremental_refresh_matches_full_refresh(tmp_path):
+    tables = make_source()
+    source = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    write_source(source, tables)
+
+    cron = make_cron(tmp_path, "incremental")
+    # first cycle opens the change log and loads everything
+    cron.refresh()
+    assert isinstance(cron.change_source, FileChangeSource)
+
+    # a deal's last, commented task moves to an earlier day, its metrics and sketch day change
+    last_tasks = tables["deal_task"].groupby("deal_id")["id"].max()
+    last_tasks = last_tasks[last_tasks.isin(tables["deal_comment"]["deal_task_id"])]
+    task = (tables["deal_task"]["id"] == last_tasks.iloc[0]).idxmax()
+    deal_task = tables["deal_task"].loc[task].copy()
+    deal_task["status"] = "done"
+    deal_task["task_status"] = "transfer"
+    deal_task["created_at"] -= pd.Timedelta("2D")
+    comment = tables["deal_comment"].iloc[0].copy()
+    comment["id"] = tables["deal_comment"]["id"].max() + 1
+    comment["deal_id"] = deal_task["deal_id"]
+    comment["deal_task_id"] = deal_task["id"]
+    comment["status"] = "win"
+    comment["created_at"] = deal_task["created_at"] + pd.Timedelta("3h")
+    mall = tables["mall"].iloc[1].copy()
+    mall["name"] = "renamed mall"
+    user = tables["user"].iloc[2].copy()
+    user["first_name"] = "renamed"
+    lead = tables["lead"].iloc[0].copy()
+    lead["id"] = tables["lead"]["id"].max() + 1
+    deal = tables["deal"].iloc[0].copy()
+    deal["id"] = tables["deal"]["id"].max() + 1
+    deal["lead_id"] = lead["id"]
+
+    tables["deal_task"].loc[task] = deal_task
+    tables["deal_comment"].loc[len(tables["deal_comment"])] = comment
+    tables["mall"].iloc[1] = mall
+    tables["user"].iloc[2] = user
+    tables["lead"].loc[len(tables["lead"])] = lead
+    tables["deal"].loc[len(tables["deal"])] = deal
+    write_source(source, tables)
+
+    changes = [
+        ("deal_task", deal_task),
+        ("deal_comment", comment),
+        ("mall", mall),
+        ("user", user),
+        ("lead", lead),
+        ("deal", deal),
+    ]
+    with open(tmp_path / "changes.jsonl", "w", encoding="utf-8") as f:
+        for table, row in changes:
+            f.write(json.dumps({"table": table, "row": json.loads(row.to_json())}))
+            f.write("\n")
+
+    lead_ids, deal_ids = cron.resolve_changes(cron.change_source.read())
+    assert lead["id"] in lead_ids and deal["id"] in deal_ids
+    assert deal_task["deal_id"] in deal_ids
+    cron.change_source.offset = 0
+    cron.refresh()
+
+    full = make_cron(tmp_path, "full")
+    full.fetch()
+    for table in [
+        "lead_insight",
+        "user_performance",
+        "lead_insight_filter",
+        "user_performance_filter",
+    ]:
+        pd.testing.assert_frame_equal(read_table(cron, table), read_table(full, table))
+    assert "renamed mall" in read_table(cron, "lead_insight_filter")["value"].values
+    # exports are written again from the loaded tables
+    for table in ["lead_insight", "user_performance"]:
+        pd.testing.assert_frame_equal(
+            read_export(cron, table), read_export(full, table)
+        )
+    # touched days are sketched again from the loaded table
+    pd.testing.assert_frame_equal(read_sketches(cron), read_sketches(full))
+
+    # a full refresh only sketches the days whose rows changed, here a task left out of the log
+    task = (tables["deal_task"]["id"] == last_tasks.iloc[-1]).idxmax()
+    tables["deal_task"].loc[task, "created_at"] -= pd.Timedelta("5D")
+    write_source(source, tables)
+    cron.fetch()
+    full = make_cron(tmp_path, "full-after")
+    full.fetch()
+    pd.testing.assert_frame_equal(read_sketches(cron), read_sketches(full))
@@ -0,0 +1,54 @@
+import os
+
+import pandas as pd
+
+from lotus_dashboard.export import LATEST, read_latest, write_frame
+
+
+def write_ids(directory, ids: list, **kwargs):
+    df = pd.DataFrame({"lead_id": ids})
+    return os.path.basename(write_frame(str(directory), "lead_insight", df, **kwargs))
+
+
+def read_ids(directory):
+    return read_latest(str(directory), "lead_insight").column("lead_id").to_pylist()
+
+
+def versions(directory):
+    return sorted(
+        file
+        for file in os.listdir(directory / "lead_insight")
+        if file.endswith(".arrow") and file != LATEST
+    )
+
+
+def test_latest_points_at_the_last_write(tmp_path):
+    first = write_ids(tmp_path, [1])
+    before = read_latest(str(tmp_path), "lead_insight")
+    second = write_ids(tmp_path, [1, 2])
+
+    link = tmp_path / "lead_insight" / LATEST
+    assert os.readlink(link) == second
+    assert read_ids(tmp_path) == [1, 2]
+    # a table read before the swap keeps its version
+    assert before.column("lead_id").to_pylist() == [1]
+    assert versions(tmp_path) == sorted([first, second])
+    assert not any(file.endswith(".tmp") for file in os.listdir(link.parent))
+
+
+def test_keeps_the_newest_versions(tmp_path):
+    written = [write_ids(tmp_path, [i], keep=2) for i in range(4)]
+
+    assert versions(tmp_path) == written[-2:]
+    assert read_ids(tmp_path) == [3]
+
+
+def test_keep_zero_keeps_only_latest(tmp_path):
+    write_ids(tmp_path, [0], keep=0)
+    before = read_latest(str(tmp_path), "lead_insight")
+    written = [write_ids(tmp_path, [i], keep=0) for i in range(1, 3)]
+
+    assert versions(tmp_path) == written[-1:]
+    assert read_ids(tmp_path) == [2]
+    # open memory maps survive the unlink
+    assert before.column("lead_id").to_pylist() == [0]
@@ -0,0 +1,133 @@
+import json, re
+from datetime import datetime
+
+import pandas as pd, pytest
+from sqlalchemy import create_engine, event
+
+from lotus_cron import LotosDashboardCron
+from lotus_dashboard.models.lead_insight_filter import LeadInsightFilter
+
+
+class SqliteParallelCron(LotosDashboardCron):
+    # sqlite has no CREATE TABLE ... LIKE and no multi-table RENAME TABLE, the
+    # statements are rewritten on their way to the cursor
+    def get_local_engine(self):
+        if self.local_engine is None:
+            self.local_engine = create_engine(
+                f"sqlite:///{self.config['LOCAL_DB']}",
+                connect_args={"check_same_thread": False, "timeout": 30},
+            )
+            self.statements = []
+            self.chunk_sizes = []
+            self.fail_chunk_with = None
+            event.listen(
+                self.local_engine,
+                "before_cursor_execute",
+                self.to_sqlite,
+                retval=True,
+            )
+        return self.local_engine
+
+    def to_sqlite(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        if statement.startswith("INSERT INTO lead_insight_filter_staging"):
+            rows = parameters if executemany else [parameters]
+            self.chunk_sizes.append(len(rows))
+            if any(self.fail_chunk_with in row for row in rows):
+                raise RuntimeError("chunk failed")
+        like = re.fullmatch(r"CREATE TABLE `(\w+)` LIKE `(\w+)`", statement)
+        if like:
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (like[2],),
+            )
+            ddl = cursor.fetchone()[0]
+            statement = re.sub(r"^CREATE TABLE \S+", f"CREATE TABLE `{like[1]}`", ddl)
+        if statement.startswith("RENAME TABLE "):
+            renames = re.findall(r"`(\w+)` TO `(\w+)`", statement)
+            for old, new in renames[:-1]:
+                cursor.execute(f"ALTER TABLE `{old}` RENAME TO `{new}`")
+            statement = "ALTER TABLE `{}` RENAME TO `{}`".format(*renames[-1])
+        return statement, parameters
+
+
+def make_cron(tmp_path, parallelism=3):
+    config = {"LOCAL_DB": str(tmp_path / "local.db"), "LOAD_PARALLELISM": parallelism}
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return SqliteParallelCron(str(path))
+
+
+def make_values(values):
+    return pd.DataFrame(
+        {
+            "column_name": "mall",
+            "value": pd.array(values, dtype="string[pyarrow]"),
+            "row_count": pd.array(range(1, len(values) + 1), dtype="int64[pyarrow]"),
+            "last_seen_at": datetime(2024, 1, 1),
+            # not a column of the model
+            "extra": 0,
+        }
+    )
+
+
+def read_table(cron):
+    return pd.read_sql(
+        "SELECT id, value, row_count FROM lead_insight_filter ORDER BY id",
+        cron.get_local_engine(),
+    )
+
+
+def table_names(cron):
+    df = pd.read_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table'", cron.get_local_engine()
+    )
+    return set(df["name"])
+
+
+def test_parallel_load_chunks_and_swaps(tmp_path):
+    cron = make_cron(tmp_path)
+    cron.dataframe_to_db(LeadInsightFilter, make_values(["old a", "old b"]))
+
+    values = [f"mall {i}" for i in range(7)]
+    cron.chunk_sizes.clear()
+    cron.dataframe_to_db(LeadInsightFilter, make_values(values))
+
+    # 7 rows over 3 connections
+    assert sorted(cron.chunk_sizes) == [1, 3, 3]
+    df = read_table(cron)
+    assert df["id"].tolist() == list(range(1, 8))
+    assert df["value"].tolist() == values
+    assert df["row_count"].tolist() == list(range(1, 8))
+    assert "lead_insight_filter_staging" not in table_names(cron)
+    assert "lead_insight_filter_old" not in table_names(cron)
+
+
+def test_parallel_load_drops_staging_when_a_chunk_fails(tmp_path):
+    cron = make_cron(tmp_path)
+    cron.dataframe_to_db(LeadInsightFilter, make_values(["old a", "old b"]))
+
+    cron.fail_chunk_with = "mall 5"
+    cron.statements.clear()
+    with pytest.raises(RuntimeError, match="chunk failed"):
+        cron.dataframe_to_db(
+            LeadInsightFilter, make_values([f"mall {i}" for i in range(7)])
+        )
+
+    assert cron.statements[-1] == "DROP TABLE IF EXISTS `lead_insight_filter_staging`"
+    assert not any(s.startswith("RENAME TABLE") for s in cron.statements)
+    assert "lead_insight_filter_staging" not in table_names(cron)
+    assert read_table(cron)["value"].tolist() == ["old a", "old b"]
+
+
+def test_parallel_load_swaps_in_an_empty_table(tmp_path):
+    cron = make_cron(tmp_path)
+    cron.dataframe_to_db(LeadInsightFilter, make_values(["old a", "old b"]))
+
+    cron.chunk_sizes.clear()
+    cron.dataframe_to_db(LeadInsightFilter, make_values([]))
+
+    assert cron.chunk_sizes == []
+    assert read_table(cron).empty
+    assert "lead_insight_filter" in table_names(cron)
+    assert "lead_insight_filter_staging" not in table_names(cron)
@@ -0,0 +1,46 @@
+import importlib.util, json, os, sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_prod_config_resolves_local_redis(tmp_path, monkeypatch):
+    pytest.importorskip("cachelib")
+    config = {
+        "SECRET_KEY": "x" * 32,
+        "MYSQL_USER": "superset",
+        "MYSQL_PASSWORD": "",
+        "MYSQL_HOST": "localhost",
+        "MYSQL_PORT": 3306,
+        "MYSQL_DB": "superset",
+        "MYSQL_PARAMS": "",
+        "REDIS_URL": "redis://localhost:6379/0",
+    }
+    path = tmp_path / "config-prod.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    monkeypatch.setenv("SUPERSET_ENV", "production")
+    monkeypatch.setenv("SUPERSET_CONFIG_JSON", str(path))
+    monkeypatch.delitem(sys.modules, "superset_config", raising=False)
+
+    # the way superset loads SUPERSET_CONFIG_PATH
+    spec = importlib.util.spec_from_file_location(
+        "superset_config", os.path.join(ROOT, "superset_config_prod.py")
+    )
+    prod = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, "superset_config", prod)
+    spec.loader.exec_module(prod)
+
+    assert prod.CELERY_CONFIG.broker_url == "redis://localhost:6379/1"
+    assert prod.CELERY_CONFIG.result_backend == "redis://localhost:6379/3"
+    assert prod.GLOBAL_ASYNC_QUERIES_REDIS_CONFIG == {
+        "host": "localhost",
+        "port": 6379,
+        "password": "",
+        "db": 0,
+        "ssl": False,
+    }
+    assert prod.FEATURE_FLAGS["GLOBAL_ASYNC_QUERIES"]
+    assert prod.GLOBAL_ASYNC_QUERIES_JWT_COOKIE_SAMESITE == "None"
+    assert prod.GLOBAL_ASYNC_QUERIES_JWT_COOKIE_SECURE
+    assert prod.SQLLAB_TIMEOUT < prod.SUPERSET_WEBSERVER_TIMEOUT